@@ -7,50 +7,74 @@ This script is meant to be called by cron jobs set up by the scheduler.
 import sys
 import os
 import argparse
+import functools
+import logging
+import re
 from datetime import datetime, timedelta
-from pathlib import Path
-import yaml
 from dotenv import load_dotenv
 
 # Add the project root to the path
-project_root = Path(__file__).parent
-sys.path.insert(0, str(project_root))
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
 
-from src.client import AlteaClient
-from src.notifications import EmailNotifier
-from src.calendar import add_to_calendar
+from src.config import load_yaml_cached
 
-# Load environment variables
-load_dotenv()
+# Fields every user in users.yaml must define
+REQUIRED_USER_FIELDS = ('altea_email', 'altea_password', 'notification_email')
 
+# Separator line for console banners
+_BAR = '=' * 70
 
+# --date format; a cheap match instead of fromisoformat's wider ISO grammar
+_DATE_RE = re.compile(r'^(\d{4})-(\d{1,2})-(\d{1,2})$')
+
+
+@functools.lru_cache(maxsize=4)
 def load_config(config_path='classes.yaml'):
-    """Load the classes configuration file."""
-    config_file = project_root / config_path
+    """
+    Load the classes configuration file.
     
-    if not config_file.exists():
+    Results are memoized per process; callers must treat them as read-only.
+    """
+    config_file = os.path.join(project_root, config_path)
+    
+    try:
+        config = load_yaml_cached(config_file)
+    except FileNotFoundError:
         print(f"Error: Configuration file not found: {config_file}")
         sys.exit(1)
     
-    with open(config_file, 'r') as f:
-        config = yaml.safe_load(f)
+    config['_index'] = build_class_index(config.get('classes', []))
     
     return config
 
 
+@functools.lru_cache(maxsize=4)
 def load_users(users_path='users.yaml'):
-    """Load the users configuration file."""
-    users_file = project_root / users_path
+    """
+    Load the users configuration file.
+    
+    Results are memoized per process; callers must treat them as read-only.
+    """
+    users_file = os.path.join(project_root, users_path)
     
-    if not users_file.exists():
+    try:
+        users_config = load_yaml_cached(users_file)
+    except FileNotFoundError:
         print(f"Error: Users configuration file not found: {users_file}")
         print("Copy users.example.yaml to users.yaml and configure your credentials.")
         sys.exit(1)
     
-    with open(users_file, 'r') as f:
-        users_config = yaml.safe_load(f)
+    users = users_config.get('users', {})
+    
+    # Validate every user once here so lookups can trust the result
+    for user_name, user in users.items():
+        for field in REQUIRED_USER_FIELDS:
+            if not (user or {}).get(field):
+                print(f"Error: Missing '{field}' for user '{user_name}' in users.yaml")
+                sys.exit(1)
     
-    return users_config.get('users', {})
+    return users
 
 
 def get_user_credentials(users, user_name):
@@ -64,20 +88,12 @@ def get_user_credentials(users, user_name):
     Returns:
         Dictionary with altea_email, altea_password, notification_email
     """
-    if user_name not in users:
+    try:
+        return users[user_name]
+    except KeyError:
         print(f"Error: User '{user_name}' not found in users.yaml")
         print(f"Available users: {', '.join(users.keys())}")
         sys.exit(1)
-    
-    user = users[user_name]
-    
-    required_fields = ['altea_email', 'altea_password', 'notification_email']
-    for field in required_fields:
-        if field not in user or not user[field]:
-            print(f"Error: Missing '{field}' for user '{user_name}' in users.yaml")
-            sys.exit(1)
-    
-    return user
 
 
 def get_day_name(date_obj):
@@ -85,7 +101,32 @@ def get_day_name(date_obj):
     return date_obj.strftime('%A')
 
 
-def find_class_for_date(config, target_date, time_filter=None, user_filter=None):
+def build_class_index(classes):
+    """
+    Index class entries by (day, time, user) so lookups don't scan the list.
+    
+    Each entry is filed under its exact key plus the keys with time and/or
+    user replaced by None, which is what an unfiltered lookup uses.
+    
+    Args:
+        classes: List of class configurations from classes.yaml
+    
+    Returns:
+        Dictionary mapping (day, time, user) to matching entries, in file order
+    """
+    index = {}
+    
+    for class_config in classes:
+        day = class_config['day']
+        time = class_config.get('time')
+        user = class_config.get('user')
+        for key in ((day, time, user), (day, time, None), (day, None, user), (day, None, None)):
+            index.setdefault(key, []).append(class_config)
+    
+    return index
+
+
+def find_class_for_date(config, target_date, time_filter=None, user_filter=None, day_name=None):
     """
     Find the class configuration for a given date.
     
@@ -94,27 +135,18 @@ def find_class_for_date(config, target_date, time_filter=None, user_filter=None)
         target_date: datetime object for the target date
         time_filter: Optional time string to match (e.g., "4:30 PM")
         user_filter: Optional user name to match
+        day_name: Optional precomputed day name of target_date
     
     Returns:
         Class configuration dict or None if not found
     """
-    day_name = get_day_name(target_date)
+    if day_name is None:
+        day_name = get_day_name(target_date)
     
-    for class_config in config.get('classes', []):
-        if class_config['day'] != day_name:
-            continue
-        
-        # If time filter specified, must match
-        if time_filter and class_config.get('time') != time_filter:
-            continue
-        
-        # If user filter specified, must match
-        if user_filter and class_config.get('user') != user_filter:
-            continue
-        
-        return class_config
+    # Empty filters match anything, same as not passing them
+    matches = config['_index'].get((day_name, time_filter or None, user_filter or None))
     
-    return None
+    return matches[0] if matches else None
 
 
 def parse_arguments():
@@ -154,31 +186,44 @@ Examples:
 def main():
     args = parse_arguments()
     
+    # Show log messages from src modules (e.g. notifications) like the prints around them
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
+    
     # Determine target date
     if args.date:
+        date_error = f"Error: Invalid date format: {args.date}. Expected YYYY-MM-DD"
+        date_match = _DATE_RE.match(args.date)
+        if not date_match:
+            print(date_error)
+            sys.exit(1)
+        year, month, day = date_match.groups()
         try:
-            target_date = datetime.strptime(args.date, '%Y-%m-%d')
+            target_date = datetime(int(year), int(month), int(day))
         except ValueError:
-            print(f"Error: Invalid date format: {args.date}. Expected YYYY-MM-DD")
+            print(date_error)
             sys.exit(1)
     else:
         target_date = datetime.now()
     
+    # Format each representation of the date once
+    day_name = get_day_name(target_date)
+    iso_date = target_date.strftime('%Y-%m-%d')
+    formatted_date = target_date.strftime('%d-%m-%Y')  # DD-MM-YYYY for the booking site
+    
     # Load configuration
     config = load_config(args.config)
     
     # Find class for this date (with optional time/user filters from cron)
-    class_config = find_class_for_date(config, target_date, args.time, args.user)
+    class_config = find_class_for_date(config, target_date, args.time, args.user, day_name=day_name)
     
     if not class_config:
-        day_name = get_day_name(target_date)
         filters = []
         if args.time:
             filters.append(f"time={args.time}")
         if args.user:
             filters.append(f"user={args.user}")
         filter_str = f" ({', '.join(filters)})" if filters else ""
-        print(f"No class configured for {day_name} ({target_date.strftime('%Y-%m-%d')}){filter_str}")
+        print(f"No class configured for {day_name} ({iso_date}){filter_str}")
         sys.exit(0)
     
     # Get user from class config
@@ -191,27 +236,38 @@ def main():
     users = load_users()
     user_creds = get_user_credentials(users, user_name)
     
-    # Format date for the booking script (DD-MM-YYYY)
-    formatted_date = target_date.strftime('%d-%m-%Y')
-    
     # Get settings
     settings = config.get('settings', {})
     headless = settings.get('headless', True)
+    debug = settings.get('debug', False)
     
-    print(f"\n{'='*70}")
-    print(f"BOOKING FROM CONFIG FILE")
-    print(f"{'='*70}")
-    print(f"Target Date: {formatted_date} ({get_day_name(target_date)})")
-    print(f"Class Time: {class_config['time']}")
-    print(f"Class Name: {class_config['name']}")
-    print(f"User: {user_name}")
-    print(f"Headless: {headless}")
-    print(f"{'='*70}\n")
+    # Emit the banner in a single write rather than one print() per line
+    banner = "\n".join([
+        f"\n{_BAR}",
+        "BOOKING FROM CONFIG FILE",
+        _BAR,
+        f"Target Date: {formatted_date} ({day_name})",
+        f"Class Time: {class_config['time']}",
+        f"Class Name: {class_config['name']}",
+        f"User: {user_name}",
+        f"Headless: {headless}",
+        f"{_BAR}\n",
+    ]) + "\n"
+    sys.stdout.write(banner)
     
     if args.dry_run:
         print("DRY RUN - No booking will be made")
         return
     
+    # Imported here so dry runs and "no class today" exits skip loading Playwright
+    from src.client import AlteaClient
+    from src.notifications import EmailNotifier
+    from src.calendar import CalendarBatcher
+    
+    # Load environment variables, unless cron/systemd already provided them
+    if not all(os.getenv(key) for key in ('MAILGUN_DOMAIN', 'MAILGUN_API_KEY', 'FROM_EMAIL')):
+        load_dotenv()
+    
     # Initialize email notifier
     try:
         notifier = EmailNotifier()
@@ -221,7 +277,11 @@ def main():
         notifier = None
     
     # Book the class using the AlteaClient with user-specific credentials
-    with AlteaClient(user_creds['altea_email'], user_creds['altea_password'], headless=headless) as client:
+    # Calendar events are queued while booking and sent in one request on exit
+    calendar_url = user_creds.get('calendar_webhook_url')
+    
+    with CalendarBatcher(calendar_url) as calendar, \
+            AlteaClient(user_creds['altea_email'], user_creds['altea_password'], headless=headless, debug=debug) as client:
         # Step 1: Login
         if not client.login():
             print("Login failed, exiting.")
@@ -229,9 +289,9 @@ def main():
         
         # Step 2: Get schedule
         schedule = client.get_schedule(formatted_date)
-        print(f"\n{'='*70}")
+        print(f"\n{_BAR}")
         print(f"Found {len(schedule)} classes on {formatted_date}")
-        print(f"{'='*70}")
+        print(_BAR)
         
         # Step 3: Find the class
         matches = client.find_class(schedule, class_config['name'], class_config['time'])
@@ -258,11 +318,9 @@ def main():
                     if success:
                         print("\n✓ Successfully booked class!")
                         
-                        # Add to Google Calendar if webhook URL is configured
-                        calendar_url = user_creds.get('calendar_webhook_url')
+                        # Queue for Google Calendar if webhook URL is configured
                         if calendar_url:
-                            add_to_calendar(
-                                webhook_url=calendar_url,
+                            calendar.add(
                                 class_title=match['title'],
                                 class_date=formatted_date,
                                 class_time=match.get('time', class_config['time'])
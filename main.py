@@ -1,38 +1,59 @@
 import sys
 import os
 import argparse
+import functools
+import logging
+import re
 import warnings
 from datetime import datetime
 from pathlib import Path
-import yaml
 from dotenv import load_dotenv
-from src.client import AlteaClient
-from src.notifications import EmailNotifier
-from src.calendar import add_to_calendar
+from src.config import load_yaml_cached
 
 # Suppress urllib3 OpenSSL warning on macOS
 warnings.filterwarnings('ignore', message='.*OpenSSL.*')
 
-# Load environment variables from .env file
-load_dotenv()
-
 # Project root for loading users.yaml
 project_root = Path(__file__).parent
 
+# Fields every user in users.yaml must define
+REQUIRED_USER_FIELDS = ('altea_email', 'altea_password', 'notification_email')
+
+# Separator line for console banners
+_BAR = '=' * 70
+
+# Command line formats: DD-MM-YYYY dates and HH:MM AM/PM times
+_DATE_RE = re.compile(r'^(0?[1-9]|[12]\d|3[01])-(0?[1-9]|1[0-2])-(\d{4})$')
+_TIME_RE = re.compile(r'^(0?[1-9]|1[0-2]):[0-5]\d\s*[AP]M$', re.IGNORECASE)
+
 
+@functools.lru_cache(maxsize=1)
 def load_users(users_path='users.yaml'):
-    """Load the users configuration file."""
+    """
+    Load the users configuration file.
+    
+    The help output (_HelpParser.format_help) and main() both need it, so the
+    parsed result is memoized; callers must treat it as read-only.
+    """
     users_file = project_root / users_path
     
-    if not users_file.exists():
+    try:
+        users_config = load_yaml_cached(users_file)
+    except FileNotFoundError:
         print(f"Error: Users configuration file not found: {users_file}")
         print("Copy users.example.yaml to users.yaml and configure your credentials.")
         sys.exit(1)
     
-    with open(users_file, 'r') as f:
-        users_config = yaml.safe_load(f)
+    users = users_config.get('users', {})
+    
+    # Validate every user once here so lookups can trust the result
+    for user_name, user in users.items():
+        for field in REQUIRED_USER_FIELDS:
+            if not (user or {}).get(field):
+                print(f"Error: Missing '{field}' for user '{user_name}' in users.yaml")
+                sys.exit(1)
     
-    return users_config.get('users', {})
+    return users
 
 
 def get_user_credentials(users, user_name):
@@ -46,35 +67,47 @@ def get_user_credentials(users, user_name):
     Returns:
         Dictionary with altea_email, altea_password, notification_email
     """
-    if user_name not in users:
+    try:
+        return users[user_name]
+    except KeyError:
         print(f"Error: User '{user_name}' not found in users.yaml")
         print(f"Available users: {', '.join(users.keys())}")
         sys.exit(1)
+
+
+@functools.lru_cache(maxsize=None)
+def _ensure_env_loaded():
+    """Load environment variables from .env at most once, and only if needed."""
+    # Skip the file entirely when cron/systemd already provided the variables
+    if not all(os.getenv(key) for key in ('MAILGUN_DOMAIN', 'MAILGUN_API_KEY', 'FROM_EMAIL')):
+        load_dotenv()
+
+
+class _HelpParser(argparse.ArgumentParser):
+    """ArgumentParser that only reads users.yaml when help is actually printed."""
     
-    user = users[user_name]
-    
-    required_fields = ['altea_email', 'altea_password', 'notification_email']
-    for field in required_fields:
-        if field not in user or not user[field]:
-            print(f"Error: Missing '{field}' for user '{user_name}' in users.yaml")
-            sys.exit(1)
-    
-    return user
+    def format_help(self):
+        # argparse resolves -h, --help and abbreviations like --hel before
+        # calling this, so the epilog is filled in exactly when it is shown
+        try:
+            available_users = list(load_users().keys())
+        except SystemExit:
+            # Missing file or an invalid user; load_users already said which
+            available_users = ['(users.yaml unavailable)']
+        template = self.epilog
+        self.epilog = template.replace('{available_users}', ", ".join(available_users))
+        try:
+            return super().format_help()
+        finally:
+            self.epilog = template
 
 
 def parse_arguments():
     """Parse and validate command line arguments."""
-    # Load users to show available options
-    try:
-        users = load_users()
-        available_users = list(users.keys())
-    except SystemExit:
-        available_users = ['(users.yaml not found)']
-    
-    parser = argparse.ArgumentParser(
+    parser = _HelpParser(
         description='Altea Active Gym Class Booking Bot',
         formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog=f'''
+        epilog='''
 Examples:
   # Book LF3 Strong class at 8:30 AM on November 29, 2025 for ryan
   python main.py "29-11-2025" "8:30 AM" "LF3 Strong" --user ryan
@@ -88,7 +121,7 @@ Examples:
 Date Format: DD-MM-YYYY (e.g., 29-11-2025)
 Time Format: HH:MM AM/PM (e.g., 8:30 AM, 12:30 PM)
 Class Name: Partial match, case-insensitive (e.g., "LF3", "Strong", "Vinyasa")
-Available Users: {", ".join(available_users)}
+Available Users: {available_users}
         '''
     )
     
@@ -105,18 +138,27 @@ Available Users: {", ".join(available_users)}
                        action='store_true',
                        default=False,
                        help='Run browser in headless mode (no GUI)')
+    parser.add_argument('--debug',
+                       action='store_true',
+                       default=False,
+                       help='Save debug screenshots even when nothing goes wrong')
     
     args = parser.parse_args()
     
-    # Validate date format
+    # Validate date format; the regex only bounds day/month, so the
+    # datetime() call still rejects dates like 31-02-2025
+    date_error = f"Invalid date format: {args.date}. Expected DD-MM-YYYY (e.g., 29-11-2025)"
+    date_match = _DATE_RE.match(args.date)
+    if not date_match:
+        parser.error(date_error)
+    day, month, year = date_match.groups()
     try:
-        datetime.strptime(args.date, '%d-%m-%Y')
+        datetime(int(year), int(month), int(day))
     except ValueError:
-        parser.error(f"Invalid date format: {args.date}. Expected DD-MM-YYYY (e.g., 29-11-2025)")
+        parser.error(date_error)
     
-    # Validate time format (basic check)
-    time_upper = args.time.upper()
-    if not ('AM' in time_upper or 'PM' in time_upper):
+    # Validate time format
+    if not _TIME_RE.match(args.time.strip()):
         parser.error(f"Invalid time format: {args.time}. Expected HH:MM AM/PM (e.g., 8:30 AM)")
     
     return args
@@ -125,6 +167,16 @@ def main():
     # Parse command line arguments
     args = parse_arguments()
     
+    # Show log messages from src modules (e.g. notifications) like the prints around them
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
+    
+    # Imported here so --help and argument errors skip loading Playwright
+    from src.client import AlteaClient
+    from src.notifications import EmailNotifier
+    from src.calendar import CalendarBatcher
+    
+    _ensure_env_loaded()
+    
     # Load users and get credentials
     users = load_users()
     user_creds = get_user_credentials(users, args.user)
@@ -138,17 +190,24 @@ def main():
         notifier = None
     
     # Print booking details
-    print(f"\n{'='*70}")
-    print(f"ALTEA BOOKING BOT")
-    print(f"{'='*70}")
-    print(f"Date: {args.date}")
-    print(f"Time: {args.time}")
-    print(f"Class: {args.class_name}")
-    print(f"User: {args.user}")
-    print(f"{'='*70}\n")
+    banner = "\n".join([
+        f"\n{_BAR}",
+        "ALTEA BOOKING BOT",
+        _BAR,
+        f"Date: {args.date}",
+        f"Time: {args.time}",
+        f"Class: {args.class_name}",
+        f"User: {args.user}",
+        f"{_BAR}\n",
+    ]) + "\n"
+    sys.stdout.write(banner)
     
     # Use context manager to automatically handle browser lifecycle
-    with AlteaClient(user_creds['altea_email'], user_creds['altea_password'], headless=args.headless) as client:
+    # Calendar events are queued while booking and sent in one request on exit
+    calendar_url = user_creds.get('calendar_webhook_url')
+    
+    with CalendarBatcher(calendar_url) as calendar, \
+            AlteaClient(user_creds['altea_email'], user_creds['altea_password'], headless=args.headless, debug=args.debug) as client:
         # Step 1: Login
         if not client.login():
             print("Login failed, exiting.")
@@ -157,14 +216,14 @@ def main():
         # Step 2: Get schedule for the specified date
         schedule = client.get_schedule(args.date)
         
-        print(f"\n{'='*70}")
+        print(f"\n{_BAR}")
         print(f"Found {len(schedule)} classes on {args.date}")
-        print(f"{'='*70}")
+        print(_BAR)
         
         # Step 3: Find the specific class
-        print(f"\n{'='*70}")
+        print(f"\n{_BAR}")
         print(f"SEARCHING FOR: {args.class_name} at {args.time}")
-        print(f"{'='*70}")
+        print(_BAR)
         
         matches = client.find_class(schedule, args.class_name, args.time)
 
@@ -192,11 +251,9 @@ def main():
                     if success:
                         print("\n✓ Successfully initiated booking!")
                         
-                        # Add to Google Calendar if webhook URL is configured
-                        calendar_url = user_creds.get('calendar_webhook_url')
+                        # Queue for Google Calendar if webhook URL is configured
                         if calendar_url:
-                            add_to_calendar(
-                                webhook_url=calendar_url,
+                            calendar.add(
                                 class_title=match['title'],
                                 class_date=args.date,
                                 class_time=match.get('time', args.time)
@@ -241,11 +298,17 @@ def main():
                         except Exception as e:
                             print(f"Warning: Failed to send failure email: {e}")
                     
-                    # Still navigate to see the page
-                    client.page.goto("https://myaltea.app" + match['url'])
-                    client.page.wait_for_load_state("networkidle")
-                    client.page.screenshot(path="debug_class_page.png")
-                    print("  Saved screenshot: debug_class_page.png")
+                    # With --debug, still navigate to see the page
+                    if args.debug:
+                        client.page.goto("https://myaltea.app" + match['url'])
+                        client.page.wait_for_load_state("domcontentloaded")
+                        try:
+                            # The class page never reaches networkidle; wait for its buttons instead
+                            client.page.locator("button").first.wait_for(timeout=10000)
+                        except Exception:
+                            pass
+                        client.page.screenshot(path="debug_class_page.png")
+                        print("  Saved screenshot: debug_class_page.png")
         else:
             print(f"\n✗ No classes found matching '{args.class_name}' at {args.time}")
             
@@ -9,43 +9,57 @@ to automatically run the booking script at the right times.
 
 import sys
 import os
+import re
+import functools
 from datetime import datetime, timedelta
 from pathlib import Path
-import yaml
 import subprocess
+from src.config import load_yaml_cached
+
+# Cron day-of-week numbers (0=Sunday)
+_DAYS = {
+    'Sunday': 0,
+    'Monday': 1,
+    'Tuesday': 2,
+    'Wednesday': 3,
+    'Thursday': 4,
+    'Friday': 5,
+    'Saturday': 6
+}
+
+# 12-hour clock time like "3:30 PM" or "03:30pm"
+_TIME_RE = re.compile(r'^\s*(\d{1,2}):(\d{2})\s*([AP])M\s*$', re.IGNORECASE)
+
+# Hardcoded rule: booking opens 7 days and 59 minutes before
+BOOKING_DAYS_BEFORE = 7
+
+# Markers delimiting the block this tool owns inside the user's crontab
+MARKER_START = '# BEGIN ALTEA BOOKING'
+MARKER_END = '# END ALTEA BOOKING'
 
 
 def load_config(config_path='classes.yaml'):
     """Load the classes configuration file."""
     config_file = Path(__file__).parent / config_path
     
-    if not config_file.exists():
+    try:
+        return load_yaml_cached(config_file)
+    except FileNotFoundError:
         print(f"Error: Configuration file not found: {config_file}")
         sys.exit(1)
-    
-    with open(config_file, 'r') as f:
-        config = yaml.safe_load(f)
-    
-    return config
 
 
+@functools.lru_cache(maxsize=64)
 def parse_time(time_str):
     """Parse time string like '3:30 PM' and return hour and minute."""
-    time_str = time_str.strip().upper()
-    
-    # Handle formats like "3:30 PM" or "03:30 PM"
-    if 'AM' in time_str or 'PM' in time_str:
-        time_part = time_str.replace('AM', '').replace('PM', '').strip()
-        hour, minute = map(int, time_part.split(':'))
-        
-        if 'PM' in time_str and hour != 12:
-            hour += 12
-        elif 'AM' in time_str and hour == 12:
-            hour = 0
-        
-        return hour, minute
-    else:
+    match = _TIME_RE.match(time_str)
+    if not match:
         raise ValueError(f"Invalid time format: {time_str}")
+    
+    # 12 AM -> 0 and 12 PM -> 12 both fall out of the modulo
+    hour = int(match[1]) % 12 + (12 if match[3].upper() == 'P' else 0)
+    
+    return hour, int(match[2])
 
 
 def calculate_booking_time(class_time_str):
@@ -79,16 +93,7 @@ def calculate_booking_time(class_time_str):
 
 def day_to_cron_day(day_name):
     """Convert day name to cron day number (0=Sunday, 1=Monday, etc.)."""
-    days = {
-        'Sunday': 0,
-        'Monday': 1,
-        'Tuesday': 2,
-        'Wednesday': 3,
-        'Thursday': 4,
-        'Friday': 5,
-        'Saturday': 6
-    }
-    return days.get(day_name)
+    return _DAYS.get(day_name)
 
 
 def calculate_cron_day(class_day, days_before):
@@ -107,7 +112,26 @@ def calculate_cron_day(class_day, days_before):
     return booking_day_num
 
 
-def generate_cron_entry(class_config, project_root, python_path, is_macos=True):
+def target_date_command(is_macos=True, days_before=BOOKING_DAYS_BEFORE):
+    """
+    Build the shell snippet cron uses to compute the class date.
+    
+    Args:
+        is_macos: True for macOS, False for Linux (date syntax differs)
+        days_before: How many days ahead of the cron run the class is
+    
+    Returns:
+        Shell command substitution printing the date as YYYY-MM-DD
+    """
+    if is_macos:
+        # macOS: date -v+7d +%Y-%m-%d
+        return f'$(date -v+{days_before}d +\\%Y-\\%m-\\%d)'
+    # Linux: date -d "+7 days" +%Y-%m-%d
+    return f'$(date -d "+{days_before} days" +\\%Y-\\%m-\\%d)'
+
+
+def generate_cron_entry(class_config, project_root, python_path, is_macos=True,
+                        date_cmd=None, script_path=None, log_dir=None):
     """
     Generate a cron job entry for a class configuration.
     
@@ -118,16 +142,20 @@ def generate_cron_entry(class_config, project_root, python_path, is_macos=True):
         project_root: Path to the project root directory
         python_path: Path to the Python interpreter to use
         is_macos: True for macOS, False for Linux
+        date_cmd: Prebuilt target_date_command() result, shared across classes
+        script_path: Prebuilt path string to book_from_config.py
+        log_dir: Prebuilt path string to the logs directory
     
     Returns:
-        Cron job string and class config
+        Tuple of (cron job string, class config, booking hour, booking minute),
+        where the booking time is before any cron_offset_minutes is applied
     """
-    # Hardcoded rule: booking opens 7 days and 59 minutes before
-    days_before = 7
+    days_before = BOOKING_DAYS_BEFORE
     
     # Calculate booking time (59 minutes before class time)
     class_time = class_config['time']
-    hour, minute = calculate_booking_time(class_time)
+    booking_hour, booking_minute = calculate_booking_time(class_time)
+    hour, minute = booking_hour, booking_minute
     
     # Apply optional cron offset (to stagger multiple bookings for same class)
     cron_offset = class_config.get('cron_offset_minutes', 0)
@@ -143,31 +171,28 @@ def generate_cron_entry(class_config, project_root, python_path, is_macos=True):
     cron_day = calculate_cron_day(class_config['day'], days_before)
     
     # Path to the booking script
-    script_path = project_root / 'book_from_config.py'
+    if script_path is None:
+        script_path = str(project_root / 'book_from_config.py')
     
     # Calculate the target date (will be handled by the script)
-    # Date command syntax differs between macOS and Linux
-    if is_macos:
-        # macOS: date -v+7d +%Y-%m-%d
-        date_cmd = f'$(date -v+{days_before}d +\\%Y-\\%m-\\%d)'
-    else:
-        # Linux: date -d "+7 days" +%Y-%m-%d
-        date_cmd = f'$(date -d "+{days_before} days" +\\%Y-\\%m-\\%d)'
+    if date_cmd is None:
+        date_cmd = target_date_command(is_macos, days_before)
     
     # Get user for this class
     user = class_config.get('user', 'unknown')
     
-    # Build the cron command with --time and --user to identify exact class entry
-    # Format: minute hour * * day-of-week command
-    cron_cmd = f'cd {project_root} && {python_path} {script_path} --date {date_cmd} --time "{class_time}" --user {user}'
-    
-    # Add log redirection (include user in log filename for clarity)
-    log_file = project_root / 'logs' / f'booking_{class_config["day"].lower()}_{user}.log'
-    cron_cmd += f' >> {log_file} 2>&1'
+    # Log file includes user in the filename for clarity
+    if log_dir is None:
+        log_dir = str(project_root / 'logs')
+    log_file = f'{log_dir}/booking_{class_config["day"].lower()}_{user}.log'
     
-    cron_line = f'{minute} {hour} * * {cron_day} {cron_cmd}'
+    # Format: minute hour * * day-of-week command
+    # --time and --user identify the exact class entry
+    cron_line = (f'{minute} {hour} * * {cron_day} '
+                 f'cd {project_root} && {python_path} {script_path} --date {date_cmd} '
+                 f'--time "{class_time}" --user {user} >> {log_file} 2>&1')
     
-    return cron_line, class_config
+    return cron_line, class_config, booking_hour, booking_minute
 
 
 def generate_crontab(config, project_root, python_path, is_macos=True):
@@ -190,11 +215,16 @@ def generate_crontab(config, project_root, python_path, is_macos=True):
         print("Warning: No classes configured in classes.yaml")
         return None
     
+    # These don't vary per class, so build them once
+    date_cmd = target_date_command(is_macos)
+    script_path = str(project_root / 'book_from_config.py')
+    log_dir = str(project_root / 'logs')
+    
     for class_config in classes:
-        cron_line, cls = generate_cron_entry(class_config, project_root, python_path, is_macos)
+        cron_line, cls, booking_hour, booking_minute = generate_cron_entry(
+            class_config, project_root, python_path, is_macos, date_cmd, script_path, log_dir)
         
-        # Calculate booking time for display
-        booking_hour, booking_minute = calculate_booking_time(cls['time'])
+        # Booking time for display
         booking_time_24h = f"{booking_hour:02d}:{booking_minute:02d}"
         
         # Add comment for readability
@@ -210,38 +240,35 @@ def generate_crontab(config, project_root, python_path, is_macos=True):
 
 
 def get_current_crontab():
-    """Get the current crontab content."""
+    """
+    Stream the current crontab, one line at a time (without newlines).
+    
+    Yields nothing if no crontab exists yet.
+    """
     try:
-        result = subprocess.run(['crontab', '-l'], 
-                              capture_output=True, 
-                              text=True,
-                              check=False)
-        if result.returncode == 0:
-            return result.stdout
-        else:
-            # No crontab exists yet
-            return ""
+        proc = subprocess.Popen(['crontab', '-l'],
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL,
+                                text=True)
     except Exception as e:
         print(f"Error reading crontab: {e}")
-        return ""
+        return
+    
+    # "no crontab for <user>" goes to stderr, so stdout is simply empty
+    with proc:
+        for line in proc.stdout:
+            yield line.rstrip('\n')
 
 
 def install_crontab(new_crontab_content):
     """Install the new crontab."""
     try:
-        # Write to temporary file
-        temp_file = Path('/tmp/altea_crontab.tmp')
-        with open(temp_file, 'w') as f:
-            f.write(new_crontab_content)
-        
-        # Install the crontab
-        result = subprocess.run(['crontab', str(temp_file)],
-                              capture_output=True,
-                              text=True,
-                              check=True)
-        
-        # Clean up
-        temp_file.unlink()
+        # Feed the crontab on stdin rather than via a temporary file
+        subprocess.run(['crontab', '-'],
+                       input=new_crontab_content,
+                       capture_output=True,
+                       text=True,
+                       check=True)
         
         return True
     except subprocess.CalledProcessError as e:
@@ -253,27 +280,58 @@ def install_crontab(new_crontab_content):
         return False
 
 
-def merge_crontabs(existing, new, marker_start='# BEGIN ALTEA BOOKING', marker_end='# END ALTEA BOOKING'):
+def _strip_altea_section(lines, marker_start=MARKER_START, marker_end=MARKER_END):
+    """
+    Drop the Altea booking section from crontab lines in a single pass.
+    
+    Lines after the start marker are only held back until the end marker
+    confirms the section; if it never shows up they are kept as-is.
+    
+    Returns:
+        Tuple of (remaining lines, whether a section was removed)
+    """
+    kept = []
+    pending = None
+    found = False
+    
+    for line in lines:
+        if pending is not None:
+            pending.append(line)
+            if marker_end in line:
+                pending = None
+                found = True
+        elif not found and marker_start in line:
+            pending = [line]
+        else:
+            kept.append(line)
+    
+    if pending:
+        kept.extend(pending)
+    
+    # Match the old strip() of the whole crontab text
+    while kept and not kept[0].strip():
+        kept.pop(0)
+    while kept and not kept[-1].strip():
+        kept.pop()
+    
+    return kept, found
+
+
+def merge_crontabs(existing, new, marker_start=MARKER_START, marker_end=MARKER_END):
     """
     Merge new crontab entries with existing ones.
     
     Replaces content between markers if they exist, otherwise appends.
+    
+    Args:
+        existing: Existing crontab, as text or an iterable of lines
+        new: New crontab content for the Altea section
     """
-    lines = existing.strip().split('\n') if existing.strip() else []
+    if isinstance(existing, str):
+        existing = existing.split('\n')
     
     # Remove old Altea booking section if it exists
-    start_idx = None
-    end_idx = None
-    
-    for i, line in enumerate(lines):
-        if marker_start in line:
-            start_idx = i
-        if marker_end in line:
-            end_idx = i
-    
-    if start_idx is not None and end_idx is not None:
-        # Remove old section
-        del lines[start_idx:end_idx+1]
+    lines, _ = _strip_altea_section(existing, marker_start, marker_end)
     
     # Add new section
     if lines and lines[-1].strip():
@@ -339,22 +397,11 @@ Examples:
     
     if args.remove:
         print("\nRemoving Altea booking cron jobs...")
-        existing = get_current_crontab()
-        
-        # Remove section between markers
-        lines = existing.strip().split('\n') if existing.strip() else []
-        start_idx = None
-        end_idx = None
-        
-        for i, line in enumerate(lines):
-            if '# BEGIN ALTEA BOOKING' in line:
-                start_idx = i
-            if '# END ALTEA BOOKING' in line:
-                end_idx = i
+        # Remove section between markers while reading the crontab
+        lines, found = _strip_altea_section(get_current_crontab())
         
-        if start_idx is not None and end_idx is not None:
-            del lines[start_idx:end_idx+1]
-            new_crontab = '\n'.join(lines).strip()
+        if found:
+            new_crontab = '\n'.join(lines)
             
             if new_crontab:
                 new_crontab += '\n'
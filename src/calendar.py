@@ -5,10 +5,48 @@ This module sends booking details to a user's deployed Google Apps Script,
 which then creates a calendar event in their Google Calendar.
 """
 
-import requests
+import functools
+import hashlib
+import random
+import re
+import time
+
 from datetime import datetime, timedelta
 
 
+# Shared session so repeat bookings in one run reuse the HTTPS connection
+# to script.google.com instead of paying a new TCP+TLS handshake each time.
+# Built on first use so runs that never touch the calendar skip importing requests.
+_session = None
+_exceptions = None
+
+# Retry policy for transient webhook failures (e.g. Apps Script cold starts)
+MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+RETRY_JITTER = 0.5
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Most events CalendarBatcher sends in a single webhook request
+MAX_BATCH_SIZE = 50
+
+# Location attached to every calendar event
+EVENT_LOCATION = 'Altea Active, 1660 Carling Ave, Ottawa, ON K2A 1C4'
+
+# Class times as Altea shows them, like '3:30 PM'
+_TIME_RE = re.compile(r'^\s*(\d{1,2}):(\d{2})\s*(AM|PM)\s*$', re.IGNORECASE)
+
+# Altea dates in DD-MM-YYYY format
+_DATE_RE = re.compile(r'^\s*(\d{1,2})-(\d{1,2})-(\d{4})\s*$')
+
+
+def _retry_delay(attempt: int) -> float:
+    """Exponential backoff with jitter for the given zero-based attempt."""
+    delay = RETRY_BASE_DELAY * 2 ** attempt * (1 + random.random() * RETRY_JITTER)
+    return min(delay, RETRY_MAX_DELAY)
+
+
+@functools.lru_cache(maxsize=256)
 def parse_class_time(time_str: str) -> tuple[int, int]:
     """
     Parse a time string like '3:30 PM' into hour and minute (24-hour format).
@@ -18,83 +56,137 @@ def parse_class_time(time_str: str) -> tuple[int, int]:
     
     Returns:
         Tuple of (hour, minute) in 24-hour format
+    
+    Raises:
+        ValueError: If the string is not an H:MM AM/PM time
     """
-    time_str = time_str.strip().upper()
+    match = _TIME_RE.match(time_str)
+    if not match:
+        raise ValueError(f"unparseable time: {time_str!r}")
     
-    if 'AM' in time_str or 'PM' in time_str:
-        time_part = time_str.replace('AM', '').replace('PM', '').strip()
-        hour, minute = map(int, time_part.split(':'))
-        
-        if 'PM' in time_str and hour != 12:
-            hour += 12
-        elif 'AM' in time_str and hour == 12:
-            hour = 0
-        
-        return hour, minute
-    else:
-        # Try parsing as 24-hour format
-        parts = time_str.split(':')
-        return int(parts[0]), int(parts[1]) if len(parts) > 1 else 0
+    hour, minute = int(match[1]), int(match[2])
+    is_pm = match[3].upper() == 'PM'
+    
+    if is_pm and hour != 12:
+        hour += 12
+    elif not is_pm and hour == 12:
+        hour = 0
+    
+    return hour, minute
 
 
-def add_to_calendar(
-    webhook_url: str,
+@functools.lru_cache(maxsize=256)
+def parse_class_date(date_str: str) -> tuple[int, int, int]:
+    """
+    Parse a date string like '29-11-2025' into year, month and day.
+    
+    Args:
+        date_str: Date string in DD-MM-YYYY format
+    
+    Returns:
+        Tuple of (year, month, day)
+    """
+    match = _DATE_RE.match(date_str)
+    if not match:
+        raise ValueError(f"unparseable date: {date_str!r}")
+    
+    return int(match[3]), int(match[2]), int(match[1])
+
+
+def _event_payload(
     class_title: str,
     class_date: str,
     class_time: str,
     duration_minutes: int = 60
-) -> bool:
+) -> dict:
     """
-    Add a booked class to Google Calendar via Apps Script webhook.
+    Build the Apps Script payload for one booked class.
     
     Args:
-        webhook_url: The deployed Google Apps Script web app URL
         class_title: Name of the class (e.g., "Strength and Conditioning")
         class_date: Date string in DD-MM-YYYY format
         class_time: Time string (e.g., "4:30 PM")
         duration_minutes: Class duration in minutes (default 60)
     
     Returns:
-        True if the calendar event was created successfully, False otherwise
+        Dictionary with the event fields expected by the Apps Script
     """
-    if not webhook_url:
-        print("⚠ No calendar webhook URL configured, skipping calendar integration")
-        return False
+    # Parse the date (DD-MM-YYYY format from Altea)
+    year, month, day = parse_class_date(class_date)
     
-    try:
-        # Parse the date (DD-MM-YYYY format from Altea)
-        day, month, year = map(int, class_date.split('-'))
-        
-        # Parse the time
-        hour, minute = parse_class_time(class_time)
-        
-        # Build start datetime
-        start_dt = datetime(year, month, day, hour, minute)
-        end_dt = start_dt + timedelta(minutes=duration_minutes)
-        
-        # Format for the Apps Script (ISO 8601)
-        payload = {
-            'title': f"🏋️ {class_title}",
-            'startTime': start_dt.isoformat(),
-            'endTime': end_dt.isoformat(),
-            'description': f"Booked via Altea Auto-Booker\nClass: {class_title}\nDate: {class_date}\nTime: {class_time}",
-            'location': 'Altea Active, 1660 Carling Ave, Ottawa, ON K2A 1C4'
-        }
-        
-        print(f"📅 Adding to calendar: {class_title} on {class_date} at {class_time}")
+    # Parse the time
+    hour, minute = parse_class_time(class_time)
+    
+    # Build start datetime
+    start_dt = datetime(year, month, day, hour, minute)
+    end_dt = start_dt + timedelta(minutes=duration_minutes)
+    
+    # Format for the Apps Script (ISO 8601)
+    start_iso = start_dt.isoformat()
+    return {
+        'title': f"🏋️ {class_title}",
+        'startTime': start_iso,
+        'endTime': end_dt.isoformat(),
+        'description': f"Booked via Altea Auto-Booker\nClass: {class_title}\nDate: {class_date}\nTime: {class_time}",
+        'location': EVENT_LOCATION,
+        # Stable across retries so the Apps Script can drop duplicates
+        'clientRequestId': hashlib.sha1(f"{class_title}|{start_iso}".encode()).hexdigest()
+    }
+
+
+def _get_session():
+    """Return the shared webhook session, creating it on first use."""
+    global _session, _exceptions
+    if _session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
         
-        # Send to the Apps Script webhook
-        response = requests.post(
-            webhook_url,
-            json=payload,
-            headers={'Content-Type': 'application/json'},
-            timeout=30
-        )
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=4))
+        _exceptions = requests.exceptions
+        _session = session
+    return _session
+
+
+def _post_to_webhook(webhook_url: str, body: dict) -> bool:
+    """
+    POST a payload to the Apps Script webhook, retrying transient failures.
+    
+    Args:
+        webhook_url: The deployed Google Apps Script web app URL
+        body: A single event payload, or {"events": [...]} for a batch
+    
+    Returns:
+        True if the webhook reported success, False otherwise
+    """
+    session = _get_session()
+    try:
+        for attempt in range(MAX_ATTEMPTS):
+            is_last_attempt = attempt == MAX_ATTEMPTS - 1
+            
+            try:
+                # json= sets the Content-Type header
+                response = session.post(
+                    webhook_url,
+                    json=body,
+                    timeout=30
+                )
+            except (_exceptions.Timeout, _exceptions.ConnectionError) as e:
+                if is_last_attempt:
+                    raise
+                reason = "timed out" if isinstance(e, _exceptions.Timeout) else "connection failed"
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES or is_last_attempt:
+                    break
+                reason = f"returned status {response.status_code}"
+            
+            delay = _retry_delay(attempt)
+            print(f"⚠ Calendar webhook {reason}, retrying in {delay:.1f}s...")
+            time.sleep(delay)
         
         if response.status_code == 200:
             result = response.json() if response.text else {}
             if result.get('success', True):  # Default to success if no JSON response
-                print("✓ Calendar event created successfully")
                 return True
             else:
                 print(f"✗ Calendar API returned error: {result.get('error', 'Unknown error')}")
@@ -103,13 +195,142 @@ def add_to_calendar(
             print(f"✗ Calendar webhook returned status {response.status_code}: {response.text}")
             return False
             
-    except requests.exceptions.Timeout:
+    except _exceptions.Timeout:
         print("✗ Calendar webhook timed out")
         return False
-    except requests.exceptions.RequestException as e:
+    except _exceptions.RequestException as e:
         print(f"✗ Calendar webhook request failed: {e}")
         return False
     except Exception as e:
         print(f"✗ Error adding to calendar: {e}")
         return False
 
+
+def add_to_calendar(
+    webhook_url: str,
+    class_title: str,
+    class_date: str,
+    class_time: str,
+    duration_minutes: int = 60
+) -> bool:
+    """
+    Add a booked class to Google Calendar via Apps Script webhook.
+    
+    Args:
+        webhook_url: The deployed Google Apps Script web app URL
+        class_title: Name of the class (e.g., "Strength and Conditioning")
+        class_date: Date string in DD-MM-YYYY format
+        class_time: Time string (e.g., "4:30 PM")
+        duration_minutes: Class duration in minutes (default 60)
+    
+    Returns:
+        True if the calendar event was created successfully, False otherwise
+    """
+    if not webhook_url:
+        print("⚠ No calendar webhook URL configured, skipping calendar integration")
+        return False
+    
+    try:
+        payload = _event_payload(class_title, class_date, class_time, duration_minutes)
+    except Exception as e:
+        print(f"✗ Error adding to calendar: {e}")
+        return False
+    
+    print(f"📅 Adding to calendar: {class_title} on {class_date} at {class_time}")
+    
+    if _post_to_webhook(webhook_url, payload):
+        print("✓ Calendar event created successfully")
+        return True
+    return False
+
+
+class CalendarBatcher:
+    """
+    Collects booked classes and sends them to the webhook together.
+    
+    Use as a context manager so queued events are flushed on exit:
+    
+        with CalendarBatcher(webhook_url) as calendar:
+            calendar.add("LF3 Strong", "29-11-2025", "8:30 AM")
+    """
+    
+    def __init__(self, webhook_url: str, max_batch_size: int = MAX_BATCH_SIZE):
+        """
+        Initialize the batcher.
+        
+        Args:
+            webhook_url: The deployed Google Apps Script web app URL
+            max_batch_size: Flush automatically once this many events are queued
+        """
+        self.webhook_url = webhook_url
+        self.max_batch_size = max_batch_size
+        self._events = []
+    
+    def __enter__(self):
+        """Context manager entry."""
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit - send any queued events."""
+        self.flush()
+    
+    def add(
+        self,
+        class_title: str,
+        class_date: str,
+        class_time: str,
+        duration_minutes: int = 60
+    ) -> bool:
+        """
+        Queue a booked class for the next flush.
+        
+        Args:
+            class_title: Name of the class (e.g., "Strength and Conditioning")
+            class_date: Date string in DD-MM-YYYY format
+            class_time: Time string (e.g., "4:30 PM")
+            duration_minutes: Class duration in minutes (default 60)
+        
+        Returns:
+            True if the event was queued, False if its date or time was invalid
+        """
+        try:
+            payload = _event_payload(class_title, class_date, class_time, duration_minutes)
+        except Exception as e:
+            print(f"✗ Error adding to calendar: {e}")
+            return False
+        
+        print(f"📅 Queued for calendar: {class_title} on {class_date} at {class_time}")
+        self._events.append(payload)
+        
+        if len(self._events) >= self.max_batch_size:
+            self.flush()
+        return True
+    
+    def flush(self) -> bool:
+        """
+        Send all queued events to the webhook.
+        
+        Returns:
+            True if every queued event was sent (or none were queued), False otherwise
+        """
+        if not self._events:
+            return True
+        
+        events, self._events = self._events, []
+        
+        if not self.webhook_url:
+            print("⚠ No calendar webhook URL configured, skipping calendar integration")
+            return False
+        
+        # A lone event keeps the single-event body older scripts understand
+        if len(events) == 1:
+            body = events[0]
+        else:
+            body = {'events': events}
+        
+        print(f"📅 Adding {len(events)} event(s) to calendar")
+        
+        if _post_to_webhook(self.webhook_url, body):
+            print("✓ Calendar event(s) created successfully")
+            return True
+        return False
@@ -1,26 +1,95 @@
 from playwright.sync_api import sync_playwright, Page, Browser
-import time
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+import re
+
+# Card text patterns checked for every class on the schedule page
+_SPOTS_RE = re.compile(r'Spots Left:\s*(\d+)', re.IGNORECASE)
+_FULL_RE = re.compile(r'Full|Join Waitlist')
+
+# Chromium flags that turn off features the bot never uses
+_LAUNCH_ARGS = [
+    "--disable-dev-shm-usage",
+    "--disable-background-networking",
+    "--disable-extensions",
+]
+
+# Static assets aborted before they are downloaded
+_BLOCKED_ASSETS = "**/*.{png,jpg,jpeg,webp,gif,woff,woff2}"
+
+# Links to individual classes on the schedule page
+_CLASS_CARD_SELECTOR = "a[href*='/booking/evt_']"
+
+# Reads every matched class card in one round-trip instead of several
+# Playwright calls per card
+_CLASS_CARDS_JS = """cards => cards.map(a => {
+    const name = a.querySelector('span.rt-Text.rt-r-size-4.rt-r-weight-bold');
+    const time = a.querySelector('span.rt-Text.rt-r-size-2.rt-r-weight-bold');
+    return {
+        href: a.getAttribute('href'),
+        name: name ? name.innerText : 'Unknown',
+        time: time ? time.innerText : 'Unknown',
+        text: a.innerText,
+    };
+})"""
+
+# Returns the scroll geometry, then scrolls down by most of a viewport so
+# consecutive views overlap and no virtually scrolled card is skipped.
+# Remembers which cards were rendered for _CARDS_CHANGED_JS.
+# Both scripts take _CLASS_CARD_SELECTOR as their argument.
+_SCROLL_JS = """selector => {
+    const doc = document.documentElement;
+    const cards = document.querySelectorAll(selector);
+    const state = {
+        top: doc.scrollTop,
+        height: doc.scrollHeight,
+        clientHeight: doc.clientHeight,
+    };
+    state.atBottom = state.top + state.clientHeight >= state.height - 10;
+    if (!state.atBottom) {
+        window.__alteaCards = cards.length ? cards[0].href + '|' + cards[cards.length - 1].href : '';
+        window.scrollBy(0, window.innerHeight * 0.9);
+    }
+    return state;
+}"""
+
+# True once the rendered cards differ from those seen before the last scroll
+_CARDS_CHANGED_JS = """selector => {
+    const cards = document.querySelectorAll(selector);
+    const current = cards.length ? cards[0].href + '|' + cards[cards.length - 1].href : '';
+    return current !== window.__alteaCards;
+}"""
 
 class AlteaClient:
-    def __init__(self, email: str, password: str, headless: bool = True):
+    def __init__(self, email: str, password: str, headless: bool = True, debug: bool = False):
         self.email = email
         self.password = password
         self.headless = headless
+        # Also save screenshots when booking succeeds, not just on errors
+        self.debug = debug
         self.browser = None
+        self.context = None
         self.page = None
         self.playwright = None
+        # Last schedule returned by get_schedule, with its find_class index
+        self._schedule = None
+        self._schedule_index = []
 
     def __enter__(self):
         """Context manager entry - starts browser"""
         self.playwright = sync_playwright().start()
-        self.browser = self.playwright.chromium.launch(headless=self.headless)
-        self.page = self.browser.new_page()
+        self.browser = self.playwright.chromium.launch(headless=self.headless, args=_LAUNCH_ARGS)
+        self.context = self.browser.new_context(permissions=[])
+        # The bot only reads text and clicks buttons, so skip image and font downloads
+        self.context.route(_BLOCKED_ASSETS, lambda route: route.abort())
+        self.page = self.context.new_page()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Context manager exit - closes browser"""
         if self.page:
             self.page.close()
+        if self.context:
+            self.context.close()
         if self.browser:
             self.browser.close()
         if self.playwright:
@@ -37,8 +106,15 @@ class AlteaClient:
             self.page.goto("https://myaltea.app")
             print("Loaded myaltea.app")
             
-            # Wait for page to load
-            self.page.wait_for_load_state("networkidle")
+            # Wait for page to load. The site keeps sockets open, so wait for
+            # the login link or form to render rather than for network idle
+            self.page.wait_for_load_state("domcontentloaded")
+            try:
+                self.page.locator("text=/log.*in/i").or_(
+                    self.page.locator("input[type='email']")
+                ).first.wait_for(timeout=10000)
+            except PlaywrightTimeoutError:
+                pass  # Handled by the login button and email input lookups below
             
             # TODO: Find and click login button
             # We need to inspect the page to find the right selectors
@@ -52,7 +128,8 @@ class AlteaClient:
                 if login_button.is_visible(timeout=5000):
                     print("Found login button, clicking...")
                     login_button.click()
-                    self.page.wait_for_load_state("networkidle")
+                    # fill() below waits for the email input to appear
+                    self.page.wait_for_load_state("domcontentloaded")
             except Exception as e:
                 print(f"Could not find login button: {e}")
                 print("Page might already show login form or we're already logged in")
@@ -81,16 +158,20 @@ class AlteaClient:
             # Wait for the page to navigate away from login
             # The site should redirect us after successful login
             print("Waiting for navigation after login...")
-            time.sleep(3)  # Give it a moment for the authentication to process
+            try:
+                # Done as soon as the login form goes away, rather than a fixed sleep
+                self.page.locator("input[type='email']").first.wait_for(state="detached", timeout=15000)
+            except PlaywrightTimeoutError:
+                pass  # Still on the login form; reported as a failure below
             
-            self.page.wait_for_load_state("networkidle")
+            self.page.wait_for_load_state("domcontentloaded")
             
             current_url = self.page.url
             print(f"Current URL after login: {current_url}")
             
             # Check if we see the "You must be logged in" message (means login failed)
-            page_text = self.page.content()
-            if "You must be logged in" in page_text:
+            # Queried in the browser rather than pulling the whole page HTML
+            if self.page.locator("text=You must be logged in").count() > 0:
                 print("✗ Login failed - not authenticated")
                 self.page.screenshot(path="debug_login_failed.png")
                 return False
@@ -124,13 +205,18 @@ class AlteaClient:
             # Navigate to booking page with date
             url = f"https://myaltea.app/booking?date={date_str}"
             self.page.goto(url)
-            self.page.wait_for_load_state("networkidle")
+            # Not networkidle: the page's websockets keep it from ever going idle.
+            # The class card wait below is the real readiness check
+            self.page.wait_for_load_state("domcontentloaded")
             
             print(f"Loaded booking page: {self.page.url}")
             
             # Wait for initial classes to load
             print("Waiting for initial classes to load...")
-            self.page.wait_for_timeout(3000)
+            try:
+                self.page.wait_for_selector(_CLASS_CARD_SELECTOR, timeout=15000)
+            except PlaywrightTimeoutError:
+                print("  No classes appeared on the page")
             
             # Scroll down slowly to load all classes (virtual scrolling)
             # Collect classes as we go since virtual scrolling removes earlier items
@@ -140,18 +226,12 @@ class AlteaClient:
             scroll_attempt = 0
             
             while scroll_attempt < 100:  # Safety limit
-                # Get current scroll position
-                scroll_height = self.page.evaluate("document.documentElement.scrollHeight")
-                scroll_top = self.page.evaluate("document.documentElement.scrollTop")
-                client_height = self.page.evaluate("document.documentElement.clientHeight")
-                
                 # Collect currently visible classes
-                class_links = self.page.locator("a[href*='/booking/evt_']").all()
+                cards = self.page.locator(_CLASS_CARD_SELECTOR).evaluate_all(_CLASS_CARDS_JS)
                 
-                for link in class_links:
+                for card in cards:
                     try:
-                        # Get the href
-                        href = link.get_attribute("href")
+                        href = card['href']
                         
                         # Skip if we've already seen this class
                         if href in seen_urls:
@@ -159,26 +239,20 @@ class AlteaClient:
                         
                         seen_urls.add(href)
                         
-                        # Get the class name
-                        # Path: a/div/div[1]/div[2]/div[1]/span
-                        name_element = link.locator("span.rt-Text.rt-r-size-4.rt-r-weight-bold").first
-                        name = name_element.inner_text(timeout=1000) if name_element.count() > 0 else "Unknown"
+                        # Name is span.rt-r-size-4 (a/div/div[1]/div[2]/div[1]/span),
+                        # time is span.rt-r-size-2 (a/div/div[1]/div[2]/div[2]/div[1]/div/div/span[1])
+                        name = card['name']
+                        time = card['time']
                         
-                        # Get the time
-                        # Path: a/div/div[1]/div[2]/div[2]/div[1]/div/div/span[1]
-                        time_element = link.locator("span.rt-Text.rt-r-size-2.rt-r-weight-bold").first
-                        time = time_element.inner_text(timeout=1000) if time_element.count() > 0 else "Unknown"
-                        
-                        # Get all text to check for spots/full status
-                        card_text = link.inner_text()
+                        # All card text, to check for spots/full status
+                        card_text = card['text']
                         
                         # Extract spots left
-                        import re
-                        spots_match = re.search(r'Spots Left:\s*(\d+)', card_text, re.IGNORECASE)
+                        spots_match = _SPOTS_RE.search(card_text)
                         spots_left = int(spots_match.group(1)) if spots_match else None
                         
                         # Check if full
-                        is_full = "Full" in card_text or "Join Waitlist" in card_text
+                        is_full = _FULL_RE.search(card_text) is not None
                         
                         class_info = {
                             'title': name.strip(),
@@ -198,16 +272,20 @@ class AlteaClient:
                         print(f"  Error parsing class: {e}")
                         continue
                 
-                # Check if we're at the bottom
-                at_bottom = (scroll_top + client_height >= scroll_height - 10)
+                # Read the scroll position and, unless at the bottom, scroll down
+                state = self.page.evaluate(_SCROLL_JS, _CLASS_CARD_SELECTOR)
+                scroll_bottom = state['top'] + state['clientHeight']
                 
-                if at_bottom:
-                    print(f"  Reached bottom of page (scroll: {scroll_top + client_height}/{scroll_height})")
+                if state['atBottom']:
+                    print(f"  Reached bottom of page (scroll: {scroll_bottom}/{state['height']})")
                     break
                 
-                # Scroll down
-                self.page.evaluate("window.scrollBy(0, 400)")
-                self.page.wait_for_timeout(300)
+                # Continue as soon as the rendered cards change, or after the
+                # same 300ms the old fixed pause used if they never do
+                try:
+                    self.page.wait_for_function(_CARDS_CHANGED_JS, arg=_CLASS_CARD_SELECTOR, timeout=300)
+                except PlaywrightTimeoutError:
+                    pass
                     
                 scroll_attempt += 1
             
@@ -215,6 +293,9 @@ class AlteaClient:
             
             print(f"\nSuccessfully parsed {len(classes)} classes from DOM")
             
+            self._schedule = classes
+            self._schedule_index = self._build_schedule_index(classes)
+            
             return classes
             
         except Exception as e:
@@ -225,34 +306,50 @@ class AlteaClient:
             print("Saved screenshot to debug_schedule_error.png")
             return []
 
-    def find_class(self, schedule, class_name_partial: str, time_str: str):
+    @staticmethod
+    def _build_schedule_index(schedule):
+        """
+        Normalize titles and times once so repeated find_class calls don't.
+        Returns a list of (lowercase title, uppercase time, class) tuples.
+        """
+        return [
+            (event.get('title', '').lower(), event.get('time', '').strip().upper(), event)
+            for event in schedule
+        ]
+
+    def find_class(self, schedule, class_name_partial: str, time_str: str, first_only: bool = False):
         """
         Finds classes matching the partial name and time.
         Time format: "HH:MM AM/PM" or "HH:MM" (will try to match flexibly)
-        Returns a list of matching classes.
+        Returns a list of matching classes. With first_only, the search stops
+        at the first exact time match and returns just that class.
         """
         matches = []
         
-        # Normalize the search time
+        # Reuse the index built by get_schedule when given that same schedule
+        if schedule is self._schedule:
+            index = self._schedule_index
+        else:
+            index = self._build_schedule_index(schedule)
+        
+        # Normalize the search terms
+        search_name = class_name_partial.lower()
         search_time = time_str.strip().upper()
         
-        for event in schedule:
+        for title, event_time, event in index:
             # Check if the class name matches (case-insensitive partial match)
-            title = event.get('title', '')
-            if class_name_partial.lower() in title.lower():
-                # Check if the time matches
-                event_time = event.get('time', '')
+            if search_name in title and event_time:
+                # Exact match, or just the time part (e.g., "8:30" matches "8:30 AM");
+                # only the shorter string can be contained in the longer one
+                if len(search_time) <= len(event_time):
+                    is_match = search_time in event_time
+                else:
+                    is_match = event_time in search_time
                 
-                if event_time:
-                    # Normalize event time for comparison
-                    normalized_event_time = event_time.strip().upper()
-                    
-                    # Try exact match first
-                    if normalized_event_time == search_time:
-                        matches.append(event)
-                    # Also try matching just the time part (e.g., "8:30" matches "8:30 AM")
-                    elif search_time in normalized_event_time or normalized_event_time in search_time:
-                        matches.append(event)
+                if is_match:
+                    if first_only and event_time == search_time:
+                        return [event]
+                    matches.append(event)
         
         return matches
     
@@ -279,94 +376,34 @@ class AlteaClient:
             
             print(f"Loaded class page: {self.page.url}")
             
-            # Wait for the page to fully load
-            self.page.wait_for_timeout(2000)
+            # Find the "Book Now" button: the XPath you provided, or by its text
+            print("Looking for Book Now button...")
+            xpath_button = self.page.locator("xpath=/html/body/div[4]/div/div/div/button")
+            text_button = self.page.locator("button:has-text('Book Now'), button:has-text('Book')")
+            
+            # Wait for the XPath button itself: the text selector can also
+            # match other buttons such as "My Bookings", so it is only a
+            # fallback once the preferred button has had time to render
+            try:
+                xpath_button.wait_for(state="visible", timeout=10000)
+                print("Found button via XPath")
+                book_button = xpath_button
+            except PlaywrightTimeoutError:
+                if text_button.count() == 0:
+                    print("✗ Could not find Book Now button")
+                    self.page.screenshot(path="debug_booking_error.png")
+                    print("Saved screenshot: debug_booking_error.png")
+                    return False
+                print("Button not found via XPath, using text-based selector")
+                book_button = text_button.first
             
-            # Try to find and click the "Book Now" button
-            # First try using the XPath you provided
             try:
-                print("Looking for Book Now button using XPath...")
-                book_button = self.page.locator("xpath=/html/body/div[4]/div/div/div/button")
+                print("Found Book Now button, clicking...")
+                book_button.click()
+                print("✓ Clicked Book Now button!")
+                
+                return self._confirm_booking()
                 
-                if book_button.count() > 0:
-                    print("Found button via XPath, clicking...")
-                    book_button.click()
-                    print("✓ Clicked Book Now button!")
-                    
-                    # Wait for confirmation dialog to appear
-                    self.page.wait_for_timeout(2000)
-                    
-                    # Take a screenshot of the confirmation dialog
-                    self.page.screenshot(path="debug_booking_confirmation.png")
-                    print("Saved screenshot: debug_booking_confirmation.png")
-                    
-                    # Now click the "Confirm booking" button
-                    print("Looking for Confirm booking button...")
-                    confirm_button = self.page.locator("xpath=/html/body/div[5]/div/div[3]/div/button")
-                    
-                    if confirm_button.count() > 0:
-                        print("Found Confirm booking button, clicking...")
-                        confirm_button.click()
-                        print("✓ Clicked Confirm booking button!")
-                        
-                        # Wait for booking to complete
-                        self.page.wait_for_timeout(3000)
-                        
-                        # Take a screenshot of the final result
-                        self.page.screenshot(path="debug_booking_result.png")
-                        print("Saved screenshot: debug_booking_result.png")
-                        
-                        return True
-                    else:
-                        print("✗ Could not find Confirm booking button")
-                        self.page.screenshot(path="debug_booking_error.png")
-                        print("Saved screenshot: debug_booking_error.png")
-                        return False
-                else:
-                    print("Button not found via XPath, trying text-based selector...")
-                    # Try finding by text
-                    book_button = self.page.locator("button:has-text('Book Now'), button:has-text('Book')")
-                    
-                    if book_button.count() > 0:
-                        print("Found button via text, clicking...")
-                        book_button.first.click()
-                        print("✓ Clicked Book Now button!")
-                        
-                        # Wait for confirmation dialog to appear
-                        self.page.wait_for_timeout(2000)
-                        
-                        # Take a screenshot of the confirmation dialog
-                        self.page.screenshot(path="debug_booking_confirmation.png")
-                        print("Saved screenshot: debug_booking_confirmation.png")
-                        
-                        # Now click the "Confirm booking" button
-                        print("Looking for Confirm booking button...")
-                        confirm_button = self.page.locator("xpath=/html/body/div[5]/div/div[3]/div/button")
-                        
-                        if confirm_button.count() > 0:
-                            print("Found Confirm booking button, clicking...")
-                            confirm_button.click()
-                            print("✓ Clicked Confirm booking button!")
-                            
-                            # Wait for booking to complete
-                            self.page.wait_for_timeout(3000)
-                            
-                            # Take a screenshot of the final result
-                            self.page.screenshot(path="debug_booking_result.png")
-                            print("Saved screenshot: debug_booking_result.png")
-                            
-                            return True
-                        else:
-                            print("✗ Could not find Confirm booking button")
-                            self.page.screenshot(path="debug_booking_error.png")
-                            print("Saved screenshot: debug_booking_error.png")
-                            return False
-                    else:
-                        print("✗ Could not find Book Now button")
-                        self.page.screenshot(path="debug_booking_error.png")
-                        print("Saved screenshot: debug_booking_error.png")
-                        return False
-                        
             except Exception as e:
                 print(f"Error clicking Book Now button: {e}")
                 self.page.screenshot(path="debug_booking_error.png")
@@ -380,3 +417,48 @@ class AlteaClient:
             self.page.screenshot(path="debug_booking_error.png")
             print("Saved screenshot: debug_booking_error.png")
             return False
+
+    def _confirm_booking(self):
+        """
+        Clicks "Confirm booking" in the dialog opened by the Book Now button.
+        
+        Returns:
+            True if the booking was confirmed, False otherwise
+        """
+        # Wait for confirmation dialog to appear
+        confirm_button = self.page.locator("xpath=/html/body/div[5]/div/div[3]/div/button")
+        try:
+            confirm_button.wait_for(state="visible", timeout=10000)
+        except PlaywrightTimeoutError:
+            pass  # Reported as a missing button below
+        
+        # Take a screenshot of the confirmation dialog
+        if self.debug:
+            self.page.screenshot(path="debug_booking_confirmation.png")
+            print("Saved screenshot: debug_booking_confirmation.png")
+        
+        # Now click the "Confirm booking" button
+        print("Looking for Confirm booking button...")
+        
+        if confirm_button.count() > 0:
+            print("Found Confirm booking button, clicking...")
+            confirm_button.click()
+            print("✓ Clicked Confirm booking button!")
+            
+            # Wait for booking to complete (the dialog closes)
+            try:
+                confirm_button.wait_for(state="hidden", timeout=15000)
+            except PlaywrightTimeoutError:
+                print("⚠ Confirmation dialog did not close")
+            
+            # Take a screenshot of the final result
+            if self.debug:
+                self.page.screenshot(path="debug_booking_result.png")
+                print("Saved screenshot: debug_booking_result.png")
+            
+            return True
+        else:
+            print("✗ Could not find Confirm booking button")
+            self.page.screenshot(path="debug_booking_error.png")
+            print("Saved screenshot: debug_booking_error.png")
+            return False
@@ -0,0 +1,75 @@
+"""
+Cached YAML loading for the booking scripts.
+
+Cron runs the scripts many times a week against config files that rarely
+change, so the parsed documents are pickled and reused until the source
+file's mtime or size changes.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+import yaml
+
+# Prefer the libyaml-backed loader; fall back to pure Python if it isn't built
+Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Parsed YAML is pickled here between runs. It lives inside the project
+# (not /tmp) because users.yaml holds passwords and the pickle gets loaded back.
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache')
+
+
+def load_yaml_cached(yaml_file, cache_dir: str = CACHE_DIR):
+    """
+    Parse a YAML file, reusing the pickled result of a previous run when the
+    file's mtime and size haven't changed.
+    
+    Args:
+        yaml_file: Path to the YAML file (str or Path)
+        cache_dir: Directory holding the pickled results
+    
+    Returns:
+        The parsed YAML document
+    
+    Raises:
+        FileNotFoundError: If yaml_file doesn't exist
+    """
+    stat = os.stat(yaml_file)
+    resolved = os.path.realpath(yaml_file)
+    key = (resolved, stat.st_mtime_ns, stat.st_size)
+    
+    # One cache file per YAML file; the key stored inside decides if it's stale
+    cache_file = os.path.join(cache_dir, f"altea_cfg_{hashlib.sha1(resolved.encode()).hexdigest()}.pkl")
+    
+    try:
+        with open(cache_file, 'rb') as f:
+            cached_key, data = pickle.load(f)
+        if cached_key == key:
+            return data
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Warning: Ignoring unreadable config cache {cache_file}: {e}")
+    
+    # Hand libyaml the raw bytes in one read; it decodes UTF-8 itself
+    with open(yaml_file, 'rb') as f:
+        raw = f.read()
+    data = yaml.load(raw, Loader=Loader)
+    
+    # Write atomically so a concurrent cron job never reads a partial pickle
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((key, data), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_file)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError as e:
+        print(f"Warning: Could not write config cache: {e}")
+    
+    return data
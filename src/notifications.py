@@ -3,10 +3,143 @@ Email notification service for Altea booking bot.
 Sends booking success/failure notifications via Mailgun.
 """
 
+import functools
+import json
+import logging
 import os
-import requests
+import time
+from dataclasses import dataclass, field
 from datetime import datetime
+from pathlib import Path
 from typing import Optional
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from src.config import CACHE_DIR
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+# Footer timestamp format, e.g. "2025-11-29 08:30:05 AM"
+TIMESTAMP_FORMAT = '%Y-%m-%d %I:%M:%S %p'
+
+# Mailgun requests per second, and how many may go out back to back
+MAILGUN_RATE_LIMIT = 5
+MAILGUN_BURST = 10
+
+# Most recipients Mailgun accepts in one batch send on the flex plan
+MAILGUN_BATCH_SIZE = 10
+
+
+def _bytecode_cache():
+    """
+    Build the on-disk cache for compiled templates, or None if it can't be used.
+    
+    Lives in the project's private .cache directory rather than a shared temp
+    directory, and any failure only costs the cache, never the import.
+    """
+    directory = os.path.join(CACHE_DIR, 'jinja')
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        return FileSystemBytecodeCache(directory)
+    except (OSError, RuntimeError) as e:
+        log.warning("⚠ Template cache disabled: %s", e)
+        return None
+
+
+# Email bodies live in src/templates: base_email.html holds the shared
+# layout and styles, and each notification extends it.
+# Compiled once at import; autoescape covers class titles and error messages.
+# Each cron run is a new process, so compiled templates are also cached on disk.
+_ENV = Environment(
+    loader=FileSystemLoader(Path(__file__).parent / 'templates'),
+    autoescape=True,
+    trim_blocks=True,
+    lstrip_blocks=True,
+    bytecode_cache=_bytecode_cache()
+)
+_SUCCESS_TEMPLATE = _ENV.get_template('success_email.html')
+_FAILURE_TEMPLATE = _ENV.get_template('failure_email.html')
+
+# Placeholder rendered in place of the timestamp so cached HTML stays reusable
+_TIMESTAMP_SENTINEL = '__ALTEA_TIMESTAMP__'
+
+
+@functools.lru_cache(maxsize=128)
+def _render_cached(template, class_items: tuple, **context) -> str:
+    """Render a template once per distinct class and context, leaving the timestamp as a placeholder."""
+    return template.render(
+        timestamp=_TIMESTAMP_SENTINEL,
+        **dict(class_items),
+        **context
+    )
+
+
+def _render_email(template, class_info: dict, timestamp: str, **context) -> str:
+    """Render an email, reusing the cached HTML when the same class is rendered again."""
+    html = _render_cached(template, tuple(sorted(class_info.items())), **context)
+    return html.replace(_TIMESTAMP_SENTINEL, timestamp)
+
+
+class MailgunError(RuntimeError):
+    """Raised when Mailgun rejects a send request."""
+
+
+class TokenBucket:
+    """Token bucket rate limiter: allows bursts of `capacity`, refilling at `rate` per second."""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+    
+    def acquire(self):
+        """Take one token, sleeping until one is available if the bucket is empty."""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        
+        if self._tokens < 1:
+            time.sleep((1 - self._tokens) / self.rate)
+            self._tokens = 1.0
+            self._updated = time.monotonic()
+        
+        self._tokens -= 1
+
+
+@dataclass(frozen=True)
+class MailgunConfig:
+    """Mailgun settings read from the environment."""
+    
+    domain: str
+    api_key: str = field(repr=False)  # Keep the key out of logs and tracebacks
+    from_email: str
+    
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def from_env(cls) -> 'MailgunConfig':
+        """
+        Read and validate the Mailgun environment variables.
+        
+        Read on first use rather than at import, since the entry scripts load
+        .env after importing this module. A successful read is cached; a
+        failed one raises and is retried on the next call.
+        
+        Raises:
+            ValueError: If any of the variables is missing
+        """
+        config = cls(
+            domain=os.getenv('MAILGUN_DOMAIN'),
+            api_key=os.getenv('MAILGUN_API_KEY'),
+            from_email=os.getenv('FROM_EMAIL')
+        )
+        
+        if not all([config.domain, config.api_key, config.from_email]):
+            raise ValueError(
+                "Missing required environment variables. "
+                "Please set MAILGUN_DOMAIN, MAILGUN_API_KEY, and FROM_EMAIL in .env file."
+            )
+        
+        return config
 
 
 class EmailNotifier:
@@ -14,15 +147,41 @@ class EmailNotifier:
     
     def __init__(self):
         """Initialize with environment variables."""
-        self.mailgun_domain = os.getenv('MAILGUN_DOMAIN')
-        self.mailgun_api_key = os.getenv('MAILGUN_API_KEY')
-        self.from_email = os.getenv('FROM_EMAIL')
+        self.config = MailgunConfig.from_env()
         
-        if not all([self.mailgun_domain, self.mailgun_api_key, self.from_email]):
-            raise ValueError(
-                "Missing required environment variables. "
-                "Please set MAILGUN_DOMAIN, MAILGUN_API_KEY, and FROM_EMAIL in .env file."
+        # Created by the first send, so runs that never email skip importing requests
+        self._session = None
+        
+        # Self-pace Mailgun requests rather than hitting its rate limit
+        self._bucket = TokenBucket(rate=MAILGUN_RATE_LIMIT, capacity=MAILGUN_BURST)
+    
+    def _get_session(self):
+        """Return the pooled HTTP session, creating it on first use."""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            
+            # Retry transient failures with backoff. POST is opted in since a
+            # duplicate notification beats a lost one; raise_on_status=False
+            # hands the final response to send_email's status check
+            retries = Retry(
+                total=4,
+                backoff_factor=0.5,
+                status_forcelist=[429, 502, 503, 504],
+                allowed_methods=frozenset(['POST']),
+                respect_retry_after_header=True,
+                raise_on_status=False
             )
+            
+            # One pooled session so several notifications share a TLS connection
+            self._session = requests.Session()
+            self._session.mount('https://', HTTPAdapter(
+                pool_connections=2,
+                pool_maxsize=4,
+                max_retries=retries
+            ))
+        return self._session
     
     def send_email(self, to_emails: list, subject: str, html_content: str):
         """
@@ -34,182 +193,66 @@ class EmailNotifier:
             html_content: HTML email body
             
         Returns:
-            Response from Mailgun API
+            Response from Mailgun API (for the last batch when there are several)
+        
+        Raises:
+            ValueError: If to_emails is empty
+            MailgunError: If Mailgun rejects the request
         """
-        url = f"https://api.mailgun.net/v3/{self.mailgun_domain}/messages"
+        if not to_emails:
+            raise ValueError("no recipients")
         
-        data = {
-            "from": self.from_email,
-            "to": to_emails,
-            "subject": subject,
-            "html": html_content
-        }
+        url = f"https://api.mailgun.net/v3/{self.config.domain}/messages"
+        session = self._get_session()
         
-        response = requests.post(
-            url,
-            auth=("api", self.mailgun_api_key),
-            data=data
-        )
+        # Several recipients go out as Mailgun batch sends, so each one only
+        # sees their own address; batches stay within the flex plan limit
+        for start in range(0, len(to_emails), MAILGUN_BATCH_SIZE):
+            batch = to_emails[start:start + MAILGUN_BATCH_SIZE]
+            
+            data = {
+                "from": self.config.from_email,
+                "to": batch,
+                "subject": subject,
+                "html": html_content
+            }
+            if len(batch) > 1:
+                data["recipient-variables"] = json.dumps({email: {"email": email} for email in batch})
+            
+            self._bucket.acquire()
+            response = session.post(
+                url,
+                auth=("api", self.config.api_key),
+                data=data,
+                timeout=(3.05, 10)  # (connect, read) seconds
+            )
+            
+            if not response.ok:
+                # Error pages can be large; keep enough of the body to diagnose
+                raise MailgunError(f"Mailgun {response.status_code}: {response.text[:500]}")
         
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise Exception(f"Failed to send email: {response.status_code} - {response.text}")
+        return response.json()
     
-    def generate_success_email(self, class_info: dict, user_name: str) -> str:
+    def generate_success_email(self, class_info: dict, user_name: str, *, timestamp: Optional[str] = None) -> str:
         """
         Generate HTML for successful booking notification.
         
         Args:
             class_info: Dictionary with class details (title, time, date, url, spots_left)
             user_name: Name of the user the booking was made for
+            timestamp: Preformatted footer timestamp (defaults to now)
             
         Returns:
             HTML email content
         """
-        html = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <style>
-        body {{
-            font-family: 'Helvetica Neue', Arial, sans-serif;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            margin: 0;
-            padding: 20px;
-            color: #333;
-        }}
-        .container {{
-            max-width: 600px;
-            margin: 0 auto;
-            background-color: #ffffff;
-            border-radius: 10px;
-            padding: 30px;
-            box-shadow: 0 10px 40px rgba(0,0,0,0.2);
-        }}
-        .header {{
-            text-align: center;
-            margin-bottom: 30px;
-            padding-bottom: 20px;
-            border-bottom: 3px solid #667eea;
-        }}
-        .success-icon {{
-            font-size: 64px;
-            margin-bottom: 10px;
-        }}
-        .title {{
-            font-size: 32px;
-            font-weight: bold;
-            color: #667eea;
-            margin: 10px 0;
-        }}
-        .subtitle {{
-            font-size: 18px;
-            color: #666;
-            margin-top: 5px;
-        }}
-        .class-card {{
-            background: linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%);
-            border-left: 5px solid #667eea;
-            border-radius: 8px;
-            padding: 25px;
-            margin: 25px 0;
-        }}
-        .class-title {{
-            font-size: 24px;
-            font-weight: bold;
-            color: #333;
-            margin-bottom: 15px;
-        }}
-        .detail-row {{
-            display: flex;
-            justify-content: space-between;
-            margin: 10px 0;
-            padding: 8px 0;
-            border-bottom: 1px solid rgba(102, 126, 234, 0.2);
-        }}
-        .detail-label {{
-            font-weight: bold;
-            color: #667eea;
-        }}
-        .detail-value {{
-            color: #333;
-        }}
-        .message {{
-            text-align: center;
-            font-size: 16px;
-            color: #666;
-            margin: 25px 0;
-            line-height: 1.6;
-        }}
-        .footer {{
-            text-align: center;
-            margin-top: 30px;
-            padding-top: 20px;
-            border-top: 2px solid #e0e0e0;
-            color: #999;
-            font-size: 14px;
-        }}
-        .timestamp {{
-            font-size: 12px;
-            color: #999;
-            text-align: center;
-            margin-top: 15px;
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <div class="success-icon">✅</div>
-            <h1 class="title">Booking Successful!</h1>
-            <p class="subtitle">Class booked for {user_name.title()}</p>
-        </div>
-        
-        <div class="class-card">
-            <div class="class-title">{class_info.get('title', 'Unknown Class')}</div>
-            
-            <div class="detail-row">
-                <span class="detail-label">📅 Date:</span>
-                <span class="detail-value">{class_info.get('date', 'N/A')}</span>
-            </div>
-            
-            <div class="detail-row">
-                <span class="detail-label">⏰ Time:</span>
-                <span class="detail-value">{class_info.get('time', 'N/A')}</span>
-            </div>
-            
-            <div class="detail-row">
-                <span class="detail-label">👥 Spots Left:</span>
-                <span class="detail-value">{class_info.get('spots_left', 'N/A')}</span>
-            </div>
-            
-            <div class="detail-row">
-                <span class="detail-label">🔗 Class URL:</span>
-                <span class="detail-value">
-                    <a href="https://myaltea.app{class_info.get('url', '')}" style="color: #667eea;">View Class</a>
-                </span>
-            </div>
-        </div>
-        
-        <div class="message">
-            🎉 Your spot has been successfully reserved!<br>
-            See you at the gym!
-        </div>
-        
-        <div class="footer">
-            <p>This is an automated notification from your Altea Booking Bot</p>
-            <div class="timestamp">Booked at {datetime.now().strftime('%Y-%m-%d %I:%M:%S %p')}</div>
-        </div>
-    </div>
-</body>
-</html>
-"""
-        return html
+        return _render_email(
+            _SUCCESS_TEMPLATE,
+            class_info,
+            timestamp or datetime.now().strftime(TIMESTAMP_FORMAT),
+            recipient_name=user_name.title()
+        )
     
-    def generate_failure_email(self, class_info: dict, error_message: str, user_name: str) -> str:
+    def generate_failure_email(self, class_info: dict, error_message: str, user_name: str, *, timestamp: Optional[str] = None) -> str:
         """
         Generate HTML for failed booking notification.
         
@@ -217,165 +260,18 @@ class EmailNotifier:
             class_info: Dictionary with class details
             error_message: Description of what went wrong
             user_name: Name of the user the booking was attempted for
+            timestamp: Preformatted footer timestamp (defaults to now)
             
         Returns:
             HTML email content
         """
-        html = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <style>
-        body {{
-            font-family: 'Helvetica Neue', Arial, sans-serif;
-            background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%);
-            margin: 0;
-            padding: 20px;
-            color: #333;
-        }}
-        .container {{
-            max-width: 600px;
-            margin: 0 auto;
-            background-color: #ffffff;
-            border-radius: 10px;
-            padding: 30px;
-            box-shadow: 0 10px 40px rgba(0,0,0,0.2);
-        }}
-        .header {{
-            text-align: center;
-            margin-bottom: 30px;
-            padding-bottom: 20px;
-            border-bottom: 3px solid #f5576c;
-        }}
-        .error-icon {{
-            font-size: 64px;
-            margin-bottom: 10px;
-        }}
-        .title {{
-            font-size: 32px;
-            font-weight: bold;
-            color: #f5576c;
-            margin: 10px 0;
-        }}
-        .subtitle {{
-            font-size: 18px;
-            color: #666;
-            margin-top: 5px;
-        }}
-        .class-card {{
-            background: linear-gradient(135deg, #fff5f5 0%, #ffe0e0 100%);
-            border-left: 5px solid #f5576c;
-            border-radius: 8px;
-            padding: 25px;
-            margin: 25px 0;
-        }}
-        .class-title {{
-            font-size: 24px;
-            font-weight: bold;
-            color: #333;
-            margin-bottom: 15px;
-        }}
-        .detail-row {{
-            display: flex;
-            justify-content: space-between;
-            margin: 10px 0;
-            padding: 8px 0;
-            border-bottom: 1px solid rgba(245, 87, 108, 0.2);
-        }}
-        .detail-label {{
-            font-weight: bold;
-            color: #f5576c;
-        }}
-        .detail-value {{
-            color: #333;
-        }}
-        .error-box {{
-            background-color: #fff5f5;
-            border: 2px solid #f5576c;
-            border-radius: 8px;
-            padding: 20px;
-            margin: 25px 0;
-        }}
-        .error-title {{
-            font-weight: bold;
-            color: #f5576c;
-            margin-bottom: 10px;
-            font-size: 16px;
-        }}
-        .error-message {{
-            color: #666;
-            line-height: 1.6;
-        }}
-        .message {{
-            text-align: center;
-            font-size: 16px;
-            color: #666;
-            margin: 25px 0;
-            line-height: 1.6;
-        }}
-        .footer {{
-            text-align: center;
-            margin-top: 30px;
-            padding-top: 20px;
-            border-top: 2px solid #e0e0e0;
-            color: #999;
-            font-size: 14px;
-        }}
-        .timestamp {{
-            font-size: 12px;
-            color: #999;
-            text-align: center;
-            margin-top: 15px;
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <div class="error-icon">❌</div>
-            <h1 class="title">Booking Failed</h1>
-            <p class="subtitle">Could not book class for {user_name.title()}</p>
-        </div>
-        
-        <div class="class-card">
-            <div class="class-title">{class_info.get('title', 'Unknown Class')}</div>
-            
-            <div class="detail-row">
-                <span class="detail-label">📅 Date:</span>
-                <span class="detail-value">{class_info.get('date', 'N/A')}</span>
-            </div>
-            
-            <div class="detail-row">
-                <span class="detail-label">⏰ Time:</span>
-                <span class="detail-value">{class_info.get('time', 'N/A')}</span>
-            </div>
-            
-            <div class="detail-row">
-                <span class="detail-label">👥 Spots Left:</span>
-                <span class="detail-value">{class_info.get('spots_left', 'N/A')}</span>
-            </div>
-        </div>
-        
-        <div class="error-box">
-            <div class="error-title">⚠️ Error Details:</div>
-            <div class="error-message">{error_message}</div>
-        </div>
-        
-        <div class="message">
-            Please check the class availability and try booking manually if needed.
-        </div>
-        
-        <div class="footer">
-            <p>This is an automated notification from your Altea Booking Bot</p>
-            <div class="timestamp">Attempted at {datetime.now().strftime('%Y-%m-%d %I:%M:%S %p')}</div>
-        </div>
-    </div>
-</body>
-</html>
-"""
-        return html
+        return _render_email(
+            _FAILURE_TEMPLATE,
+            class_info,
+            timestamp or datetime.now().strftime(TIMESTAMP_FORMAT),
+            recipient_name=user_name.title(),
+            error_message=error_message
+        )
     
     def send_booking_success(self, class_info: dict, user_name: str, user_email: str):
         """
@@ -386,19 +282,20 @@ class EmailNotifier:
             user_name: Name of the user
             user_email: Email address of the user to notify
         """
-        html = self.generate_success_email(class_info, user_name)
+        timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
+        html = self.generate_success_email(class_info, user_name, timestamp=timestamp)
         subject = f"✅ Booking Confirmed: {class_info.get('title', 'Class')} on {class_info.get('date', '')}"
         
         recipients = [user_email]
         
-        print(f"\n📧 Sending success notification to: {', '.join(recipients)}")
+        log.info("\n📧 Sending success notification to: %s", ', '.join(recipients))
         
         try:
             response = self.send_email(recipients, subject, html)
-            print(f"✓ Email sent successfully! Message ID: {response.get('id', 'N/A')}")
+            log.info("✓ Email sent successfully! Message ID: %s", response.get('id', 'N/A'))
             return response
         except Exception as e:
-            print(f"✗ Failed to send email: {e}")
+            log.error("✗ Failed to send email: %s", e)
             raise
     
     def send_booking_failure(self, class_info: dict, error_message: str, user_name: str, user_email: str):
@@ -411,17 +308,18 @@ class EmailNotifier:
             user_name: Name of the user
             user_email: Email address of the user to notify
         """
-        html = self.generate_failure_email(class_info, error_message, user_name)
+        timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
+        html = self.generate_failure_email(class_info, error_message, user_name, timestamp=timestamp)
         subject = f"❌ Booking Failed: {class_info.get('title', 'Class')} on {class_info.get('date', '')}"
         
         recipients = [user_email]
         
-        print(f"\n📧 Sending failure notification to: {', '.join(recipients)}")
+        log.info("\n📧 Sending failure notification to: %s", ', '.join(recipients))
         
         try:
             response = self.send_email(recipients, subject, html)
-            print(f"✓ Email sent successfully! Message ID: {response.get('id', 'N/A')}")
+            log.info("✓ Email sent successfully! Message ID: %s", response.get('id', 'N/A'))
             return response
         except Exception as e:
-            print(f"✗ Failed to send email: {e}")
+            log.error("✗ Failed to send email: %s", e)
             raise